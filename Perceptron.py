@@ -1,7 +1,7 @@
 import sys
 import getopt
-import random
-import math
+import functools
+import numpy as np
 
 class Perceptron:
     '''
@@ -18,71 +18,300 @@ class Perceptron:
             Once set, the bias does not change.
         - Has a learning rate, so that corrections are neither too large, nor too small.
             Once set, the learning rate does not change.
-    Any perceptron should have methods for initialization, activate(), train(), and query()
+    Any perceptron should have methods for initialization, train(), and query()
     '''
-    def __init__(self, inputs: int=2, learning_rate: float=.01, bias: float=0.0):
+    def __new__(cls, inputs: int=2, *args, **kwargs):
+        # a perceptron with 2 inputs is created as a Perceptron2, which is written out for exactly 2 weights
+        if cls is Perceptron and inputs == 2:
+            cls = Perceptron2
+        return super().__new__(cls)
+
+    def __getnewargs__(self):
+        # lets copy and pickle create the same class that the original perceptron was created as
+        return (len(self.weights),)
+
+    def __init__(self, inputs: int=2, learning_rate: float=.01, bias: float=0.0, rng=None):
         '''
         Initializes a new perceptron.
         :param inputs: Number of inputs for this instance
         :param learning_rate: How much to change the weights when a prediction is incorrect
         :param bias: offset for the activation function
-        :param activation_function: an externally provided function that calculates what to return from a train() or query() call
+        :param rng: the numpy random number generator to draw the weights from. Default is numpy's global one
         '''
         self.bias = bias
         self.learning_rate = learning_rate
-        # create a list of weights, 1 weight for each input
-        self.weights = [0] * inputs
-        # initialize the weights to small, nonzero, random values
-        for i in range(len(self.weights)):
-            self.weights[i] = random.random() * 0.99 + .01  # sample from [0.01,1)
+        if rng is None:
+            rng = np.random
+        # create an array of weights, 1 weight for each input, initialized to small, nonzero, random values
+        self.weights = rng.uniform(0.01, 1.0, size=inputs)  # sample from [0.01,1)
 
-    def activate(self, value: float) -> float:
+    def _as_values(self, values):
         '''
-        This is the activation function. It returns the predicted result. In a neural network, this
-        would be a sigmoid or some similar differentiable function that returns a value in the range (0,1).
-        In the case of a single purpose perceptron, it is sufficient to use a simple step function
-        that returns 0 or 1, by comparing the incoming value+bias to 0.
-        :param value: sum of the weighted inputs
-        :return 0 if the sum is less than 0, otherwise returns 1
+        :param values: a list or array of input values, one for each weight
+        :return: the values as an array, which the compiled code can read
         '''
+        v = values if isinstance(values, np.ndarray) else np.asarray(values, dtype=np.float64)
+        # the compiled code does not check that there is a value for every weight
+        if len(v) != len(self.weights):
+            raise ValueError(f'expected {len(self.weights)} input values, got {len(v)}')
+        return v
 
-        return 0 if value + self.bias < 0 else 1
-
-        # this is the sigmoid function, in case you want to try it out
-        # return 0 if (1 / (1 + math.exp(-1 * (value+self.bias)))) < .5 else 1
-
-    def train(self, values: [], target: int):
+    def train(self, values, target: int):
         '''
         The perceptron can be trained by providing training data and an expected result. If it guesses
         wrong, the weight for each input will be adjusted.
-        :param values: a list of input values, one for each weight
+        :param values: a list or array of input values, one for each weight
         :param target: the expected result (0 or 1)
         :return: the query result
         '''
-        result = self.query(values)
-        if (target != result):
-            # the result was incorrect. Modify the weights according to whether 0 or 1 was expected
-            # Change the weights according to the value * learning rate.
-            for i in range(len(self.weights)):
-                self.weights[i] += ((target - result) * values[i] * self.learning_rate)
-            self.bias += ((target - result) * self.learning_rate)
+        v = self._as_values(values)
+        result, self.bias = _train_step(self.weights, v, target, self.bias, self.learning_rate)
         return result
 
     def query(self, values):
         '''
         The perceptron can be tested by providing training data but no expected result.
         Each raw input is modified by the weight for that input, then the sum of the inputs
-        is passed to the activation function. The activation function decides how to classify the value.
-        :param values: a list of input values, one for each weight
-        :return: the result of the activation function
+        is passed to the activation function, which decides how to classify the value. In a neural network, this
+        would be a sigmoid or some similar differentiable function that returns a value in the range (0,1).
+        In the case of a single purpose perceptron, it is sufficient to use a simple step function
+        that returns 0 or 1, by comparing the sum + bias to 0.
+        :param values: a list or array of input values, one for each weight
+        :return 0 if the sum + bias is less than 0, otherwise returns 1
         '''
-        weighted_sum = 0
-        for i in range(len(self.weights)):
-            weighted_sum += (self.weights[i] * values[i])
-        return self.activate(weighted_sum)
+        v = self._as_values(values)
+        return 0 if _weighted_sum(self.weights, v) + self.bias < 0 else 1
+
+
+class Perceptron2(Perceptron):
+    '''
+    A perceptron with exactly 2 inputs, which is what Perceptron(inputs=2) creates. The 2 weights are kept
+    as separate numbers, w0 and w1, so that query() and train() can use them directly instead of looping over
+    an array of weights. The weights property still returns them as an array, but the array is a read-only copy:
+    changing it would not change the perceptron, so the weights can only be changed by assigning a new array to
+    weights, e.g. p.weights = w.
+    '''
+    @property
+    def weights(self):
+        weights = np.array([self.w0, self.w1])
+        weights.flags.writeable = False
+        return weights
+
+    @weights.setter
+    def weights(self, weights):
+        if len(weights) != 2:
+            raise ValueError(f'expected 2 weights, got {len(weights)}')
+        self.w0 = float(weights[0])
+        self.w1 = float(weights[1])
+
+    def train(self, values, target: int):
+        '''
+        Same as Perceptron.train(), for 2 input values.
+        '''
+        # unpacking the values also checks that there are exactly 2 of them
+        try:
+            x, y = values
+        except ValueError:
+            raise ValueError(f'expected 2 input values, got {len(values)}') from None
+        # this is query(), written out here to save the method call
+        result = 0 if self.w0 * x + self.w1 * y + self.bias < 0 else 1
+        # In Python, skipping the 3 attribute updates when the result was correct is cheaper than applying a
+        # correction of 0, unlike in the compiled code
+        if result != target:
+            # Values and targets from numpy arrays are numpy numbers, and any arithmetic with them gives numpy floats,
+            # so the corrections are converted to keep w0, w1 and the bias plain floats, which are faster to work with
+            delta = float((target - result) * self.learning_rate)
+            self.w0 += float(delta * x)
+            self.w1 += float(delta * y)
+            self.bias += delta
+        return result
+
+    def query(self, values):
+        '''
+        Same as Perceptron.query(), for 2 input values.
+        '''
+        try:
+            x, y = values
+        except ValueError:
+            raise ValueError(f'expected 2 input values, got {len(values)}') from None
+        return 0 if self.w0 * x + self.w1 * y + self.bias < 0 else 1
+
+
+# Importing numba takes about half a second, which is longer than a short run takes altogether, so it is only
+# imported the first time one of the functions below is called. Then all of them are compiled with numba.njit, and
+# replace the uncompiled functions in this module.
+_uncompiled = {}
+
+
+def _njit(**options):
+    '''
+    Marks a function to be compiled with numba.njit(**options) when it is first needed.
+    As with numba.njit, the uncompiled Python function is still available as py_func.
+    '''
+    def decorate(function):
+        _uncompiled[function.__name__] = (function, options)
+
+        @functools.wraps(function)
+        def compile_and_call(*args):
+            _compile()
+            return globals()[function.__name__](*args)
+        compile_and_call.py_func = function
+        return compile_and_call
+    return decorate
+
+
+def _compile():
+    '''
+    Imports numba, and replaces each function marked by _njit() with its compiled version
+    '''
+    from numba import njit
+    for name, (function, options) in _uncompiled.items():
+        globals()[name] = njit(**options)(function)
+    _uncompiled.clear()
+
+
+# query() and train() do very little work per call, so the arithmetic on the weights is done by these small
+# compiled functions. They are compiled the first time they are used, and cached on disk for later runs.
+@_njit(cache=True)
+def _weighted_sum(weights, values):
+    '''
+    :return: the sum of each value multiplied by its weight
+    '''
+    weighted_sum = 0.0
+    for i in range(len(weights)):
+        weighted_sum += weights[i] * values[i]
+    return weighted_sum
+
+
+@_njit(cache=True)
+def _adjust_weights(weights, values, delta):
+    '''
+    Changes each weight, in place, by its value * delta
+    '''
+    for i in range(len(weights)):
+        weights[i] += delta * values[i]
+
+
+@_njit(cache=True)
+def _train_step(weights, values, target, bias, learn):
+    '''
+    One step of Perceptron.train(): queries the values, then modifies the weights, in place, and the bias according
+    to whether 0 or 1 was expected. When the result was correct, target - result is 0 and nothing changes, so there
+    is no need to check for it first.
+    :return: the query result, and the new bias
+    '''
+    result = int(_weighted_sum(weights, values) + bias >= 0.0)
+    delta = (target - result) * learn
+    _adjust_weights(weights, values, delta)
+    return result, bias + delta
+
+
+# number of x,y pairs that are generated at a time to train the perceptron
+SAMPLE_BLOCK_SIZE = 4096
+# Most runs are over within a few thousand x,y pairs, which take milliseconds to train on in Python, while importing
+# numba and loading the compiled training loops takes about half a second. So the training loops are only compiled
+# if the training goes on past this many x,y pairs.
+UNCOMPILED_SAMPLES = 16 * SAMPLE_BLOCK_SIZE
+
+
+def generate_samples(rng, size, x_coefficient, y_coeffient, constant_term, lowrange, highrange):
+    '''
+    Generates a block of random training data, along with the intended result for each x,y pair.
+    :param rng: the numpy random number generator to draw the values from
+    :param size: the number of x,y pairs to generate
+    :return: an array of x,y pairs in the range [lowrange, highrange], and an array of the expected results (0 or 1)
+    '''
+    samples = rng.uniform(lowrange + .01, highrange, size=(size, 2))
+    # We have to know the intended result in order to perform the training: ax + by > c for all of the pairs is one
+    # matrix-vector product. The comparison is already 0 or 1 for each pair, so it is used as the result directly,
+    # as an int8 view rather than a converted copy.
+    targets = (samples @ np.array([x_coefficient, y_coeffient]) > constant_term).view(np.int8)
+    return samples, targets
+
+
+@_njit(cache=True, fastmath=True)
+def _train_until(weights, bias, learn, samples, targets, count, correct):
+    '''
+    Compiled version of the training loop in main(), for when the individual steps do not need to be shown.
+    It trains the weights and bias on the x,y pairs exactly as Perceptron.train() does, until the prediction
+    has been correct the requested number of times in a row, or the samples are used up.
+    :param weights: the perceptron weights, updated in place
+    :param bias: the starting bias
+    :param learn: the learning rate
+    :param samples: x,y pairs, as returned by generate_samples()
+    :param targets: the expected result for each x,y pair
+    :param count: the number of correct guesses in a row so far
+    :param correct: the number of correct guesses in a row that terminates the training
+    :return: the number of samples used, the number of correct guesses in a row, and the trained bias
+    '''
+    for i in range(len(targets)):
+        x = samples[i, 0]
+        y = samples[i, 1]
+        target = targets[i]
+        # the step function as a comparison converted to 0 or 1, which compiles to a compare without a branch
+        result = int(weights[0] * x + weights[1] * y + bias >= 0.0)
+        # the correction is 0 when the result was correct, so it can be applied unconditionally
+        delta = (target - result) * learn
+        weights[0] += delta * x
+        weights[1] += delta * y
+        bias += delta
+        if result == target:
+            count += 1
+            if count >= correct:
+                return i + 1, count, bias
+        else:
+            count = 0
+    return len(targets), count, bias
+
+
+@_njit(cache=True, fastmath=True)
+def _train_batch(weights, bias, learn, samples, x_coefficient, y_coeffient, constant_term, count, correct):
+    '''
+    Compiled version of one mini-batch in main(). Every x,y pair is queried with the same weights and bias, and
+    compared to the intended result, ax + by > c. The corrections for the pairs that were guessed wrong are added
+    up in the same pass, and applied once at the end, so the samples are read only once. If the prediction has been
+    correct the requested number of times in a row before the end of the batch, training stops there, and the
+    weights and bias are left as they were, since those are the ones that made the correct predictions.
+    :param weights: the perceptron weights, updated in place
+    :param bias: the starting bias
+    :param learn: the learning rate
+    :param samples: the x,y pairs in the batch
+    :param x_coefficient: a, the coefficient of x in the intended result
+    :param y_coeffient: b, the coefficient of y in the intended result
+    :param constant_term: c, the constant term in the intended result
+    :param count: the number of correct guesses in a row before this batch
+    :param correct: the number of correct guesses in a row that terminates the training
+    :return: the number of samples used, the number of wrong guesses, the number of correct guesses in a row, and
+        the corrected bias
+    '''
+    w0 = 0.0
+    w1 = 0.0
+    b = 0.0
+    wrong = 0
+    for i in range(len(samples)):
+        x = samples[i, 0]
+        y = samples[i, 1]
+        target = int(x_coefficient * x + y_coeffient * y > constant_term)
+        result = int(weights[0] * x + weights[1] * y + bias >= 0.0)
+        # the correction is 0 when the result was correct, so it can be added unconditionally
+        error = target - result
+        w0 += error * x
+        w1 += error * y
+        b += error
+        if error == 0:
+            count += 1
+            if count >= correct:
+                return i + 1, wrong, count, bias
+        else:
+            wrong += 1
+            count = 0
+    weights[0] += learn * w0
+    weights[1] += learn * w1
+    return len(samples), wrong, count, bias + learn * b
+
 
 def usage():
-    print('Usage: python Perceptron -a A -b B [-c C] [--learn L] [--lowrange R] [--highrange S] [--correct T]')
+    print('Usage: python Perceptron -a A -b B [-c C] [--learn L] [--lowrange R] [--highrange S] [--correct T] [--batch B] [--seed N] [--samples N] [-v|--verbose]')
     print('This perceptron generates random X,Y pairs in the specified range and separates them according to a standard form straight line equation ax + by = c')
     print('Parameters: x,y coefficients are required. The constant, learn, lowrange, highrange, and correct values are optional')
     print('   a: coefficient of X')
@@ -91,8 +320,14 @@ def usage():
     print('   Learn: This is the learning rate, or how much the weights will change if the perceptron ')
     print('      guesses incorrectly. It should be a small value. Default is .005')
     print('   Lowrange: This is the low end of the range of generated X and Y values. Default is -10')
-    print('   Highrange: This is the high end of the range of generated X and Y values. Default is 10')
+    print('   Highrange: This is the high end of the range of generated X and Y values. Default is 10. It must be at least .01 more than lowrange')
     print('   Correct: This is the maximum number of correct guesses in a row, to terminate the test. Default is 100')
+    print('   Batch: The number of x,y pairs the perceptron is trained on at a time. With more than one, the weights are')
+    print('      corrected once per batch, by the sum of the corrections for the batch. Default is 1')
+    print('   Seed: seed for the random weights and x,y values, so that a run can be repeated exactly. A whole number from 0 to 4294967295')
+    print('   Samples: train on exactly this many x,y pairs, instead of until the result is correct T times in a row.')
+    print('      This gives a fixed amount of work, e.g. for profiling')
+    print('   Verbose: show the result of every training step')
     print('Example: python Perceptron.py -a 1.4 -b -5 -c 13 --learn .0005 --lowrange -10 --highrange 10 --correct 200')
     print('   In this example, the perceptron solves for the inequality 1.4x -5y - 13 > 0')
     print('   Corrections to the weights are multiples of .0005')
@@ -105,8 +340,8 @@ def usage():
 def main():
     '''
     Collect command line parameters, create Perceptron, train it until it can separate randomly generated x,y values
-    100 times in a row. Show the actual and learned formulas in y = mx + b format. If -v is used, let the user enter
-    some test x,y values.
+    100 times in a row. Show the actual and learned formulas in y = mx + b format. If -v is used, show every
+    training step.
     '''
     x_coefficient = None
     y_coeffient = None
@@ -115,8 +350,12 @@ def main():
     lowrange = -10
     highrange = 10
     correct = 100
+    batch = 1
+    seed = None
+    limit = None
+    verbose = False
     try:
-        options, remainder = getopt.getopt(args=sys.argv[1:], shortopts='a:b:c:', longopts=['learn=', 'lowrange=', 'highrange=', 'correct='])
+        options, remainder = getopt.getopt(args=sys.argv[1:], shortopts='a:b:c:v', longopts=['learn=', 'lowrange=', 'highrange=', 'correct=', 'batch=', 'seed=', 'samples=', 'verbose'])
         for opt, arg in options:
             if opt in ('-a'):
                 x_coefficient = float(arg)
@@ -131,45 +370,96 @@ def main():
             elif opt in ('--highrange'):
                 highrange = float(arg)
             elif opt in ('--correct'):
-                correct = float(arg)
+                correct = int(arg)
+            elif opt in ('--batch'):
+                batch = int(arg)
+            elif opt in ('--seed'):
+                seed = int(arg)
+            elif opt in ('--samples'):
+                limit = int(arg)
+            elif opt in ('-v', '--verbose'):
+                verbose = True
         if remainder:
             usage()
         if not x_coefficient or not y_coeffient:
             usage()
-        if not highrange > lowrange:
+        # the x,y values are drawn from [lowrange + .01, highrange), which must not be empty, and must not be wider
+        # than the largest float
+        if not lowrange + .01 <= highrange or not np.isfinite(highrange - lowrange):
+            usage()
+        if batch < 1:
+            usage()
+        if limit is not None and limit < 1:
             usage()
-    except Exception as e:
+        if seed is not None and not 0 <= seed < 2**32:
+            usage()
+    except (getopt.GetoptError, ValueError):
         usage()
 
     # The perceptron only needs to know the y-intercept, which is the bias from the origin
     y_intercept = constant_term / y_coeffient
     slope = -1 * x_coefficient / y_coeffient
-    perceptron = Perceptron(inputs=2, bias=.1, learning_rate=learn)
+    if limit is None:
+        limit = sys.maxsize
+    else:
+        # the number of samples is fixed, so the number of correct guesses in a row no longer ends the training
+        correct = sys.maxsize
+    # the weights, and then the x,y values, are drawn from the same random number generator, so that a seed
+    # repeats both
+    rng = np.random.default_rng(seed)
+    perceptron = Perceptron(inputs=2, bias=.1, learning_rate=learn, rng=rng)
 
-    # x,y will be generated from random values in the range [lowrange, highrange] and used to train the perceptron
+    # x,y will be generated from random values in the range [lowrange, highrange] and used to train the perceptron.
+    # They are generated a block at a time, and a new block is generated whenever the previous one is used up.
+    # the steps are collected and written out once at the end, rather than printed one at a time
+    log = []
     i = 0
     count = 0
-    while (count < correct):
-        i += 1
-        x = random.random() * (highrange - lowrange - .01) + .01 + lowrange
-        y = random.random() * (highrange - lowrange - .01) + .01 + lowrange
-        # we have to know the intended result in order to perform the training
-        target = 1 if (x_coefficient * x + y_coeffient * y - constant_term > 0) else 0
-        result = perceptron.train([x, y], target)
-        print('{}. {} target: {} result: {} x: {} y: {} xwt {}  ywt {} bias {} {}'.
-              format(i, str(result == target),
-                     target,
-                     result,
-                     round(x, 2),
-                     round(y, 2),
-                     round(perceptron.weights[0], 2),
-                     round(perceptron.weights[1], 2),
-                     round(perceptron.bias, 2),
-                     '**********************************************************' if result != target else ''))
-        if result == target:
-            count += 1
+    while (count < correct and i < limit):
+        size = min(batch if batch > 1 else SAMPLE_BLOCK_SIZE, limit - i)
+        if batch > 1:
+            # Mini-batch training: query the whole batch at once, then correct the weights once, by the sum of the
+            # corrections for the pairs that were guessed wrong, as the batch perceptron does. The intended results
+            # are worked out in the compiled loop, as each pair is queried, so only the x,y pairs are generated here.
+            samples = rng.uniform(lowrange + .01, highrange, size=(size, 2))
+            weights = perceptron.weights.copy()
+            train_batch = _train_batch.py_func if i < UNCOMPILED_SAMPLES else _train_batch
+            used, wrong, count, perceptron.bias = train_batch(weights, perceptron.bias, learn, samples,
+                                                              x_coefficient, y_coeffient, constant_term, count,
+                                                              correct)
+            perceptron.weights = weights
+            i += used
+            if verbose:
+                log.append(f'{i}. wrong: {wrong} xwt {weights[0]:.2f}  ywt {weights[1]:.2f} '
+                           f'bias {perceptron.bias:.2f}\n')
         else:
-            count = 0
+            samples, targets = generate_samples(rng, size, x_coefficient, y_coeffient, constant_term, lowrange,
+                                                highrange)
+            if not verbose and i >= UNCOMPILED_SAMPLES:
+                # the compiled loop trains exactly like the loop below, without printing every step. It changes the
+                # weights in place, so it is given a copy, which is assigned back after
+                weights = perceptron.weights.copy()
+                used, count, perceptron.bias = _train_until(weights, perceptron.bias, learn, samples, targets, count, correct)
+                perceptron.weights = weights
+                i += used
+            else:
+                # each x,y pair is already a list of 2 floats, which the perceptron can read directly
+                for values, target in zip(samples.tolist(), targets.tolist()):
+                    i += 1
+                    result = perceptron.train(values, target)
+                    if verbose:
+                        x, y = values
+                        weights = perceptron.weights
+                        log.append(f'{i}. {result == target} target: {target} result: {result} x: {x:.2f} y: {y:.2f} '
+                                   f'xwt {weights[0]:.2f}  ywt {weights[1]:.2f} bias {perceptron.bias:.2f} '
+                                   f'{"**********************************************************" if result != target else ""}\n')
+                    if result == target:
+                        count += 1
+                        if count >= correct:
+                            break
+                    else:
+                        count = 0
+    sys.stdout.write(''.join(log))
     print ("Predicted result correctly {} times in a row, after {} attempts".format(count, i))
     calculated_y_intercept = -perceptron.bias / perceptron.weights[1]
     calculated_slope = -perceptron.weights[0] / perceptron.weights[1]
@@ -181,6 +471,5 @@ def main():
                                                                     round(abs(calculated_y_intercept),1)))
 
 
-
-
-main()
+if __name__ == '__main__':
+    main()